@@ -0,0 +1,148 @@
+'''
+Checks the statistics and threshold tests in utils.py. Needs nothing beyond the standard library
+and pytest.
+'''
+
+import math
+import random
+from fractions import Fraction
+
+import pytest
+
+import utils
+
+
+def two_pass(values):
+    ''' Population mean and SD computed the textbook way, with a second pass over the values.'''
+
+    mean = sum(values) / len(values)
+    return mean, math.sqrt(sum((v - mean)**2 for v in values) / len(values))
+
+
+def assert_stats_close(got, expected):
+    for g, e in zip(got, expected):
+        assert math.isclose(g, e, rel_tol=1e-12, abs_tol=1e-12), (got, expected)
+
+
+def make_pane(timestamp, counts):
+    ''' Pane with one IP per entry of counts, making that many requests.'''
+
+    pane = utils.Pane(timestamp)
+    for i, c in enumerate(counts):
+        for _ in range(c):
+            pane.update('10.0.0.%d' % i)
+
+    return pane
+
+
+def make_window(window_length, n_requests):
+    ''' Window shifted with one Pane per entry of n_requests, each from distinct IPs.'''
+
+    window = utils.Window(window_length)
+    for t, n in enumerate(n_requests):
+        window.shift_window(make_pane(t, [1]*n))
+
+    return window
+
+
+def test_pane_ip_stats_matches_two_pass():
+
+    rng = random.Random(0)
+
+    for _ in range(50):
+        pane = utils.Pane(0)
+        for _ in range(rng.randint(1, 300)):
+            pane.update('10.0.0.%d' % rng.randint(0, 20))
+        pane.update_many({'10.0.0.%d' % rng.randint(0, 30): rng.randint(1, 50) for _ in range(5)})
+
+        counts = list(pane.ip_list.values())
+        assert pane.n_requests == sum(counts)
+        assert pane.sum_v_sq == sum(v*v for v in counts)
+        assert_stats_close(pane.ip_stats(), two_pass(counts))
+
+
+def exceeds_2sd_exact(x, values):
+    ''' Whether x > mean + 2 SD of values, in exact rational arithmetic.'''
+
+    mean = Fraction(sum(values), len(values))
+    var = sum((v - mean)**2 for v in values) / len(values)
+    d = x - mean
+    return d > 0 and d*d > 4*var
+
+
+@pytest.mark.parametrize('window_length', [1, 2, 3, 7])
+def test_window_stats_match_two_pass_across_evictions(window_length):
+
+    rng = random.Random(window_length)
+    window = utils.Window(window_length)
+    n_requests = []
+
+    for t in range(40):
+        n = rng.randint(0, 60)
+        window.shift_window(make_pane(t, [1]*n))
+        n_requests.append(n)
+
+        # Only the last window_length Panes remain after the deque starts evicting.
+        kept = n_requests[-window_length:]
+        assert len(window) == len(kept)
+        assert t in window and (t < window_length or t - window_length not in window)
+        assert window.request_sums() == (len(kept), sum(kept), sum(v*v for v in kept))
+        assert_stats_close(window.get_request_stats(), two_pass(kept))
+
+        for x in range(0, 100, 3):
+            assert window.exceeds_threshold(x) == exceeds_2sd_exact(x, kept)
+
+
+@pytest.mark.parametrize('window_length', [0, -1])
+def test_window_rejects_length_below_one(window_length):
+
+    with pytest.raises(ValueError):
+        utils.Window(window_length)
+    with pytest.raises(ValueError):
+        utils.AttackDetector(window_length, 'log.txt')
+
+
+def test_stats_exact_for_large_counts():
+
+    # For these counts E[v^2] - E[v]^2 in floats cancels to 0.0; the variance is 2/3.
+    counts = [10**8 + 1, 10**8 + 2, 10**8 + 3]
+    expected = (10**8 + 2, math.sqrt(2/3))
+
+    pane = utils.Pane(0)
+    pane.update_many({'10.0.0.%d' % i: c for i, c in enumerate(counts)})
+    assert_stats_close(pane.ip_stats(), expected)
+
+    window = utils.Window(3)
+    for t, c in enumerate(counts):
+        big = utils.Pane(t)
+        big.update_many({'10.0.0.1': c})
+        window.shift_window(big)
+    assert_stats_close(window.get_request_stats(), expected)
+
+
+def test_exceeds_threshold_exact_tie():
+
+    # mean + 2 SD is exactly 27
+    window = make_window(5, [0, 0, 0, 0, 27])
+
+    assert window.get_request_stats() == (5.4, 10.8)
+    assert not window.exceeds_threshold(27)
+    assert window.exceeds_threshold(28)
+
+
+def test_attack_start_and_continue_use_the_same_threshold(tmp_path):
+
+    def scan(detector, n_requests):
+        detector.current_pane = make_pane(5, [n_requests])
+        detector.scan_for_attack()
+        return detector.status
+
+    detector = utils.AttackDetector(5, str(tmp_path / 'log.txt'))
+    for t, n in enumerate([0, 0, 0, 0, 27]):
+        detector.window.shift_window(make_pane(t, [1]*n))
+
+    # At the tie an attack neither starts nor continues.
+    assert not scan(detector, 27)
+    assert scan(detector, 28)
+    assert scan(detector, 28)
+    assert not scan(detector, 27)
@@ -0,0 +1,95 @@
+'''
+Checks that utils_batch.process_batch gives the same result as calling AttackDetector.process_data
+for each record, with both the pure-Python and the compiled Pane. This covers the records that
+process_data drops: the first record of each new timestamp and records whose timestamp is already
+in the Window.
+'''
+
+import logging
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('numba')
+
+import utils
+import utils_batch
+
+try:
+    import utils_fast
+except ImportError:
+    utils_fast = None
+
+
+PANES = [
+    pytest.param(utils._PyPane, id='python'),
+    pytest.param(getattr(utils_fast, 'Pane', None), id='cython',
+                 marks=pytest.mark.skipif(utils_fast is None, reason='utils_fast is not built')),
+]
+
+
+def make_records(seed, max_lag):
+    '''
+    Normal traffic with an attack burst from a few IPs and some short runs of late,
+    out-of-order records up to max_lag timestamps behind.
+    '''
+
+    rng = random.Random(seed)
+    records = []
+
+    for t in range(60):
+        attack = 30 <= t < 34
+        for _ in range(400 if attack else rng.randint(40, 60)):
+            if attack and rng.random() < 0.8:
+                ip = 'bad%d' % rng.randint(0, 2)
+            else:
+                ip = '10.0.0.%d' % rng.randint(0, 30)
+            records.append((ip, t))
+
+            if t > 3 and rng.random() < 0.01:
+                late = t - rng.randint(1, max_lag)
+                records.extend(('late%d' % rng.randint(0, 1), late) for _ in range(rng.randint(1, 3)))
+
+    return records
+
+
+def run(records, window_length, log_path, caplog, batch_size=None):
+    ''' Feed records to a new AttackDetector, per record or in batches, and return everything it produced.'''
+
+    caplog.clear()
+    detector = utils.AttackDetector(window_length, str(log_path))
+
+    if batch_size is None:
+        for ip, t in records:
+            detector.process_data(ip, t)
+    else:
+        ip_ids, _, ip_names = utils_batch.intern_ips([ip for ip, _ in records])
+        ts = np.array([t for _, t in records], dtype=np.int64)
+        for a in range(0, len(records), batch_size):
+            utils_batch.process_batch(detector, ip_ids[a:a + batch_size], ts[a:a + batch_size], ip_names)
+
+    pane = detector.current_pane
+    logged_ips = log_path.read_text() if log_path.exists() else ''
+
+    return (list(caplog.messages), logged_ips, detector.status,
+            pane.timestamp, dict(pane.ip_list), pane.n_requests, pane.sum_v_sq)
+
+
+@pytest.mark.parametrize('pane_cls', PANES)
+@pytest.mark.parametrize('window_length', [2, 3, 10])
+@pytest.mark.parametrize('seed', range(4))
+def test_process_batch_matches_process_data(monkeypatch, tmp_path, caplog, pane_cls, window_length, seed):
+
+    caplog.set_level(logging.INFO, logger='utils')
+    # Late records stay within the Window, which process_data drops.
+    records = make_records(seed, max_lag=min(3, window_length))
+
+    # Reference: one process_data call per record with the pure-Python Pane.
+    monkeypatch.setattr(utils, 'Pane', utils._PyPane)
+    expected = run(records, window_length, tmp_path / 'expected.txt', caplog)
+    assert any('Attack: True' in m for m in expected[0])
+
+    monkeypatch.setattr(utils, 'Pane', pane_cls)
+    assert run(records, window_length, tmp_path / 'per_record.txt', caplog) == expected
+    assert run(records, window_length, tmp_path / 'batched.txt', caplog, batch_size=997) == expected
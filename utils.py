@@ -1,4 +1,9 @@
+import logging
 import math
+import warnings
+from collections import deque
+
+logger = logging.getLogger(__name__)
 
 class Pane:
     '''
@@ -12,6 +17,7 @@ class Pane:
     of requests per IP stored in the Pane.
     '''
 
+    __slots__ = ('timestamp', 'ip_list', 'n_requests', 'sum_v_sq')
 
     def __init__(self, timestamp):
 
@@ -19,41 +25,83 @@ class Pane:
         self.ip_list = dict()
         self.n_requests = 0
 
+        # running sum of the squared per-IP request counts; their plain sum is n_requests
+        self.sum_v_sq = 0
+
     def update(self, ip):
         '''
         Update the IP address list with incoming IP. If not in list,
         will be added. If is in list, its counter is incremented.
-        The total number of requests is incremented.
+        The total number of requests is incremented, along with the running
+        sum of squares used by ip_stats.
         '''
 
-        if ip not in self.ip_list:
-            self.ip_list[ip] = 1
-        else:
-            self.ip_list[ip] += 1
+        # single lookup: old is 0 for a newly encountered IP
+        old = self.ip_list.get(ip, 0)
+        self.ip_list[ip] = old + 1
+        self.sum_v_sq += 2*old + 1   # (old + 1)**2 - old**2
 
         self.n_requests += 1
 
+    def update_many(self, counts):
+        '''
+        Update the IP address list with a dictionary of IP addresses and the
+        number of requests each one made, as if update had been called that
+        many times for each IP.
+        '''
+
+        for ip, c in counts.items():
+            old = self.ip_list.get(ip, 0)
+            self.ip_list[ip] = old + c
+            self.sum_v_sq += c*(2*old + c)   # (old + c)**2 - old**2
+            self.n_requests += c
+
     def ip_stats(self):
         '''
         Compute the mean and standard deviation of the number of requests
-        per IP address in this Pane.
+        per IP address in this Pane. Uses the running sums maintained by update
+        so no pass over ip_list is needed.
         '''
 
-        numer, denom, sd_temp = 0, 0, 0
-
-        # Compute mean.
-        for k, v in self.ip_list.items():
-            numer += v
-            denom += 1
-        mean = numer / denom
+        n = len(self.ip_list)
 
-        # Compute standard deviation.
-        for k, v in self.ip_list.items(): sd_temp += (mean - v)**2
-        sd = math.sqrt(sd_temp)
+        # The sums are ints, so the numerator of the variance is exact and never
+        # negative; only the final divisions are done in floating point.
+        mean = self.n_requests / n
+        var = (n*self.sum_v_sq - self.n_requests*self.n_requests) / (n*n)
+        sd = math.sqrt(var)
 
         return mean, sd
 
 
+# Use the compiled Pane from utils_fast.pyx in place of the one above if it has been built.
+# The pure-Python Pane stays available as _PyPane.
+_PyPane = Pane
+
+try:
+    from utils_fast import Pane as _FastPane
+except ImportError:
+    _FastPane = None
+
+if _FastPane is not None:
+    if hasattr(_FastPane, 'update_many'):
+        Pane = _FastPane
+    else:
+        warnings.warn("utils_fast was built from an older utils_fast.pyx and is not used; "
+                      "rebuild it with: cythonize -i utils_fast.pyx")
+
+
+
+def _exceeds_2sd(x, n, s, ss):
+    '''
+    Returns True if x is more than 2 SD's above the mean of n values with sum s and
+    sum of squares ss. x > s/n + 2*sqrt(n*ss - s*s)/n is tested as d > 0 and
+    d*d > 4*(n*ss - s*s), where d = n*x - s, so with ints there is no rounding at all.
+    '''
+
+    d = n*x - s
+    return d > 0 and d*d > 4*(n*ss - s*s)
+
 
 class Window:
 
@@ -64,23 +112,26 @@ class Window:
     the number of requests in each Pane.
     '''
 
+    __slots__ = ('window_length', 'panes', 'timestamps', 'sum_n', 'sum_n_sq')
 
     def __init__(self, window_length):
 
+        if window_length < 1:
+            raise ValueError('window_length must be at least 1, got %s' % window_length)
+
         self.window_length = window_length
-        self.panes = []
-        self.ave_requests = 0
-        self.sd_requests = 0
+        self.panes = deque(maxlen=window_length)
+        self.timestamps = set()   # timestamps of the Panes in the Window
+
+        # running sums of n_requests and n_requests**2 over the Panes in the Window
+        self.sum_n = 0
+        self.sum_n_sq = 0
 
     def __len__(self):
         return len(self.panes)
 
     def __contains__(self, timestamp):
-        for p in self.panes:
-            if p.timestamp == timestamp:
-                return True
-
-        return False
+        return timestamp in self.timestamps
 
     def shift_window(self, new_pane):
         '''
@@ -88,35 +139,63 @@ class Window:
         the oldest Pane if the length of the current window is equal to the maximum
         window length. Otherwise, the new Pane is simply added.
         '''
-        assert isinstance(new_pane, Pane)
 
-        if self.__len__() < self.window_length:
-            self.panes.append(new_pane)
-        else:
-            try:
-                self.panes.pop(0)
-            except IndexError:
-                pass
-            finally:
-                self.panes.append(new_pane)
+        # panes is a bounded deque, so appending drops the oldest Pane once full.
+        # Remove the Pane about to be dropped from the running sums and timestamps first.
+        if len(self.panes) == self.window_length:
+            old = self.panes[0]
+            self.sum_n -= old.n_requests
+            self.sum_n_sq -= old.n_requests**2
+            self.timestamps.discard(old.timestamp)
+
+        self.sum_n += new_pane.n_requests
+        self.sum_n_sq += new_pane.n_requests**2
+        self.panes.append(new_pane)
+        self.timestamps.add(new_pane.timestamp)
+
+    @property
+    def ave_requests(self):
+        ''' Mean number of requests per Pane, derived from the running sums.'''
+        n = len(self.panes)
+        return self.sum_n / n if n else 0
+
+    @property
+    def var_requests(self):
+        ''' Variance of the number of requests per Pane, derived from the running sums.'''
+        # Exact integer numerator, as in Pane.ip_stats.
+        n = len(self.panes)
+        return (n*self.sum_n_sq - self.sum_n*self.sum_n) / (n*n) if n else 0
+
+    @property
+    def sd_requests(self):
+        ''' Standard deviation of the number of requests per Pane, derived from var_requests.'''
+        return math.sqrt(self.var_requests)
 
     def get_request_stats(self):
         '''
         Computes and returns mean and standard deviation of the number of
-        requests per Pane (timestamp) in the Window.
+        requests per Pane (timestamp) in the Window from the running sums
+        maintained by shift_window.
         '''
 
-        numer, sd_temp = 0, 0
+        return self.ave_requests, self.sd_requests
 
-        # Compute mean
-        for p in self.panes: numer += p.n_requests
-        self.ave_requests = numer / self.__len__()
+    def request_sums(self):
+        '''
+        Returns the number of Panes in the Window and the running sums of their
+        number of requests and its square.
+        '''
 
-        # Compute standard deviation
-        for p in self.panes: sd_temp += (self.ave_requests - p.n_requests)**2
-        self.sd_requests = math.sqrt(sd_temp)
+        return len(self.panes), self.sum_n, self.sum_n_sq
 
-        return self.ave_requests, self.sd_requests
+    def exceeds_threshold(self, n_requests):
+        '''
+        Returns True if n_requests is more than 2 SD's above the mean number of
+        requests per Pane in the Window. Tested exactly on the integer running
+        sums, so no square root is needed.
+        '''
+
+        return _exceeds_2sd(n_requests, *self.request_sums())
 
 
 
@@ -138,6 +217,9 @@ class AttackDetector:
     order.
     '''
 
+    __slots__ = ('window', 'current_pane', 'current_timestamp', 'log_path', 'status',
+                 'normal_request_stats', 'normal_stats', 'normal_ip_stats', 'normal_ip_threshold')
+
     def __init__(self, window_length, log_path):
 
         self.window = Window(window_length)
@@ -151,35 +233,43 @@ class AttackDetector:
         self.status = False
 
         self.normal_request_stats = None
+        self.normal_stats = None          # Window request_sums() saved when an attack starts
         self.normal_ip_stats = None
+        self.normal_ip_threshold = None   # normal_ip_stats mean + 2 SD
 
 
     def process_data(self, ip, timestamp):
         '''
         Processes a log record. Takes the IP address and the timestamp.
         '''
+        # Fast path: most records belong to the current timestamp. current_timestamp is None
+        # until the first record is processed, so this also fails on the first call.
+        if timestamp == self.current_timestamp:
+            self.current_pane.update(ip)  # update current Pane with new IP request information
+            return
+
         # Create current pane if does not exist already. This logic will only be run the first time data
         # is processed.
         if self.current_pane is None:
             self.current_timestamp, self.current_pane = timestamp, Pane(timestamp)
+            self.current_pane.update(ip)
+            return
 
-        if timestamp != self.current_timestamp:
-            # Once a new timestamp is encountered, scan for attack on the previous
-            # timestamp and then add it to the window, updating the current timestamp
-            # to be the newly encountered timestamp.
+        # Once a new timestamp is encountered, scan for attack on the previous
+        # timestamp and then add it to the window, updating the current timestamp
+        # to be the newly encountered timestamp.
 
-            if timestamp not in self.window:
+        w = self.window
 
-                # must have at least two panes in window before attack scanning
-                if len(self.window) > 1: self.scan_for_attack()                        # scan for attack
+        if timestamp not in w:
 
-                print("Timestamp: %s, Number of requests: %s, Attack: %s" % (self.current_timestamp, self.current_pane.n_requests, self.status))
+            # must have at least two panes in window before attack scanning
+            if len(w) > 1: self.scan_for_attack()                                  # scan for attack
 
-                self.window.shift_window(self.current_pane)                            # shift window
-                self.current_timestamp, self.current_pane = timestamp, Pane(timestamp) # update current timestamp and add new pane
+            logger.info("Timestamp: %s, Number of requests: %s, Attack: %s", self.current_timestamp, self.current_pane.n_requests, self.status)
 
-        else:
-            self.current_pane.update(ip)  # update current Pane with new IP request information
+            w.shift_window(self.current_pane)                                      # shift window
+            self.current_timestamp, self.current_pane = timestamp, Pane(timestamp) # update current timestamp and add new pane
 
 
 
@@ -187,40 +277,29 @@ class AttackDetector:
     def check_ip_stats(self):
         '''
         Check the number of requests each IP address in the current Pane is making and
-        compare these to average of the last normal period of activity. If IP address is found that is
-        making > 2 SD requests above normal then return True, otherwise return False.
+        compare these to average of the last normal period of activity. Returns the list of
+        IP addresses making > 2 SD requests above normal, which is empty if there are none.
         '''
 
-        # indicator for if number of requests in current Pane is > 2 SD's away
-        # from the mean of the Window average.
-        #ip_status = False
-
-
-        if self.status:
-            # If currently under attack, compare IP statistics to normal_ip_stats.
-            for ip, v in self.current_pane.ip_list.items():
-                if v > self.normal_ip_stats[0] + 2*self.normal_ip_stats[1]:
-                    return True
-
-        else:
+        if not self.status:
             # If not currently under attack, set normal_ip_stats to IP statistics of the previous Pane.
-            # The compare the number of requests for the IPs in the current Pane to these.
             self.normal_ip_stats = self.window.panes[-1].ip_stats()
+            self.normal_ip_threshold = self.normal_ip_stats[0] + 2*self.normal_ip_stats[1]
 
-            for ip, v in self.current_pane.ip_list.items():
-                if v > self.normal_ip_stats[0] + 2*self.normal_ip_stats[1]:
-                    return True
+        # Compare the number of requests for the IPs in the current Pane to normal_ip_stats.
+        thr = self.normal_ip_threshold
+        suspects = [ip for ip, v in self.current_pane.ip_list.items() if v > thr]
 
-        return False
+        return suspects
 
 
-    def write_ips_to_logs(self):
-        ''' Write IP addresses that number of requests > 2 SD's above normal levels to file.'''
+    def write_ips_to_logs(self, suspects):
+        ''' Write IP addresses found by check_ip_stats to file.'''
 
-        for ip, v in self.current_pane.ip_list.items():
-            if v > self.normal_ip_stats[0] + 2*self.normal_ip_stats[1]:
-                with open(self.log_path, 'a+') as log:
-                    log.write('{}\n'.format(ip))
+        # Open the log once and write all suspected IPs in a single call.
+        if suspects:
+            with open(self.log_path, 'a') as log:
+                log.write('\n'.join(suspects) + '\n')
 
 
 
@@ -234,8 +313,12 @@ class AttackDetector:
 
         if self.status:
             # If already under attack, compare to number of requests to normal levels.
-            if self.current_pane.n_requests > self.normal_stats[0] + 2*self.normal_stats[1] and self.check_ip_stats():
-                self.write_ips_to_logs()
+            suspects = None
+            if _exceeds_2sd(self.current_pane.n_requests, *self.normal_stats):
+                suspects = self.check_ip_stats()
+
+            if suspects:
+                self.write_ips_to_logs(suspects)
             else:
                 self.status = False
         else:
@@ -243,10 +326,14 @@ class AttackDetector:
             # If if attack detected, update status and save the Window statistics for
             # future comparison in normal_stats
 
-            # Get the average and SD of the number of requests over the Window.
-            ave, sd = self.window.get_request_stats()
+            # Nothing more to do if the number of requests is within the Window's threshold.
+            if not self.window.exceeds_threshold(self.current_pane.n_requests):
+                return
+
+            suspects = self.check_ip_stats()
 
-            if self.current_pane.n_requests > ave + 2*sd and self.check_ip_stats():
+            if suspects:
+                # Save the Window's request sums so the same test is used while under attack.
                 self.status = True
-                self.normal_stats = (ave, sd)
-                self.write_ips_to_logs()
+                self.normal_stats = self.window.request_sums()
+                self.write_ips_to_logs(suspects)
@@ -0,0 +1,96 @@
+'''
+Batched ingest of log records for AttackDetector using Numba. Requires numpy and numba.
+
+Instead of calling AttackDetector.process_data once per log record, the producer interns
+the IP address strings to integer ids once (intern_ips) and hands in whole batches of
+(ip_id, timestamp) as NumPy arrays (process_batch). The per-record counting for each run
+of records with the same timestamp is done by a compiled loop over the arrays, and the
+resulting counts are merged into the current Pane in one call.
+
+Since the ids are dense, counts are kept in a contiguous int64 array indexed by id rather
+than a hash table.
+'''
+
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def ingest_batch(ip_ids, ts, start, counts, touched):
+    '''
+    Count the IP ids of the records from start to the end of its run of records with the
+    same timestamp into counts, which is indexed by id and must be all zeros on entry. The
+    ids counted are written to touched in order of first appearance. Returns the index of
+    the first record after the run and the number of ids written to touched.
+    '''
+
+    t = ts[start]
+    i, n, n_touched = start, len(ts), 0
+
+    while i < n and ts[i] == t:
+        k = ip_ids[i]
+        if counts[k] == 0:
+            touched[n_touched] = k
+            n_touched += 1
+        counts[k] += 1
+        i += 1
+
+    return i, n_touched
+
+
+def intern_ips(ips, ip_index=None, ip_names=None):
+    '''
+    Map a sequence of IP address strings to an int32 array of ids. ip_index (IP -> id) and
+    ip_names (id -> IP) may be passed in to keep ids consistent across batches; they are
+    updated with any newly encountered IPs. Returns the id array, ip_index and ip_names.
+    '''
+
+    if ip_index is None: ip_index = dict()
+    if ip_names is None: ip_names = []
+
+    ids = np.empty(len(ips), dtype=np.int32)
+
+    for i, ip in enumerate(ips):
+        k = ip_index.get(ip)
+        if k is None:
+            k = ip_index[ip] = len(ip_names)
+            ip_names.append(ip)
+        ids[i] = k
+
+    return ids, ip_index, ip_names
+
+
+def process_batch(detector, ip_ids, ts, ip_names):
+    '''
+    Processes a batch of log records in chronological order. Takes the AttackDetector, an
+    int32 array of IP ids, an int64 array of timestamps and the list mapping ids back to IP
+    addresses. The result is the same as calling detector.process_data for each record.
+    '''
+
+    i, n = 0, len(ts)
+
+    # Reused for every run; ingest_batch only leaves the touched entries of counts non-zero.
+    counts = np.zeros(len(ip_names), dtype=np.int64)
+    touched = np.empty(n, dtype=np.int32)
+
+    while i < n:
+        t = int(ts[i])
+
+        if detector.current_pane is None or t != detector.current_timestamp:
+            # First record of a new timestamp: let process_data handle the Pane creation,
+            # attack scanning and Window shift.
+            detector.process_data(ip_names[ip_ids[i]], t)
+            i += 1
+
+            if i == n or ts[i] != t:
+                continue
+
+        i, n_touched = ingest_batch(ip_ids, ts, i, counts, touched)
+
+        ids = touched[:n_touched]
+        run_counts = counts[ids]
+        counts[ids] = 0
+
+        # process_data drops records whose timestamp is already in the Window.
+        if t == detector.current_timestamp:
+            detector.current_pane.update_many({ip_names[k]: c for k, c in zip(ids.tolist(), run_counts.tolist())})